@@ -3,51 +3,126 @@
 Download profile pictures from CPJ people pages.
 """
 
+import asyncio
 import csv
 import os
 import re
+import aiohttp
 import requests
-from requests_html import HTMLSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from playwright.sync_api import sync_playwright
 from urllib.parse import urlparse
 import time
 
+USER_AGENT = 'Mozilla/5.0 (compatible; folha-cpj/1.0)'
+MAX_CONCURRENT_DOWNLOADS = 16
 
-def sanitize_filename(name):
-    # Remove or replace characters that are problematic in filenames
-    name = re.sub(r'[<>:"/\\|?*]', '', name)
-    name = name.strip()
-    return name
+# Characters that are problematic in filenames
+FILENAME_UNSAFE_TABLE = str.maketrans('', '', '<>:"/\\|?*')
 
+# Strips image extensions when recovering names from existing files
+IMAGE_EXT_RE = re.compile(r'\.(jpg|jpeg|png|gif|webp)$', re.IGNORECASE)
+
+# People whose pages had no photo on a previous run; skip them without
+# re-fetching (CPJ profiles rarely gain photos between runs)
+NO_IMAGE_CACHE_FILE = '001_no_image_cache.txt'
 
-def download_image(url, filepath):
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        return True
-    except Exception as e:
-        print(f"  Error downloading image: {e}")
-        return False
 
+def make_session():
+    """Create a pooled session so repeated page fetches reuse connections."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32,
+                          max_retries=Retry(total=3, backoff_factor=0.3))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT})
+    return session
 
-def get_profile_image(session, person_url):
+
+def sanitize_filename(name):
+    return name.translate(FILENAME_UNSAFE_TABLE).strip()
+
+
+def load_no_image_cache():
+    """Load the set of names that previously had no photo."""
+    if not os.path.exists(NO_IMAGE_CACHE_FILE):
+        return set()
+    with open(NO_IMAGE_CACHE_FILE, 'r', encoding='utf-8') as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def record_no_image(name):
+    """Append a name to the persistent no-photo cache."""
+    with open(NO_IMAGE_CACHE_FILE, 'a', encoding='utf-8') as f:
+        f.write(name + '\n')
+
+
+async def fetch(session, semaphore, url, filepath):
+    """Download one image, gated by the shared semaphore."""
+    async with semaphore:
+        # Stream into a .part file and rename on success, so a dropped
+        # connection never leaves a truncated image at the final path
+        partpath = filepath + '.part'
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+                response.raise_for_status()
+                # Stream to disk in chunks so memory stays flat per worker
+                with open(partpath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(65536):
+                        f.write(chunk)
+            os.replace(partpath, filepath)
+            print(f"  Downloaded: {os.path.basename(filepath)}")
+            return True
+        except Exception as e:
+            print(f"  Error downloading {url}: {e}")
+            if os.path.exists(partpath):
+                os.remove(partpath)
+            return False
+
+
+async def download_all(downloads):
+    """Download (url, filepath) pairs with bounded concurrency."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    connector = aiohttp.TCPConnector(limit=16, limit_per_host=8)
+    async with aiohttp.ClientSession(connector=connector,
+                                     headers={'User-Agent': USER_AGENT}) as session:
+        return await asyncio.gather(
+            *(fetch(session, semaphore, url, filepath) for url, filepath in downloads))
+
+
+# Matches the photo tag when it is present in the server-rendered HTML
+PHOTO_URL_RE = re.compile(r'<img[^>]+id=["\']photoUrl["\'][^>]+src=["\']([^"\']+)')
+
+# Distinguishes "the fetch itself failed" from "page has no photo", so
+# transient errors are never written to the negative cache
+FETCH_ERROR = object()
+
+
+def get_profile_image(session, page, person_url):
     try:
-        response = session.get(person_url)
+        response = session.get(person_url, timeout=10)
         response.raise_for_status()
 
-        # Render JavaScript to load dynamic content
-        response.html.render(timeout=20, sleep=2)
+        # Fast path: the photo tag is usually in the raw HTML already,
+        # so try a regex before paying for a browser render
+        match = PHOTO_URL_RE.search(response.text)
+        if match:
+            return match.group(1)
+
+        # Fall back to rendering JavaScript to load dynamic content,
+        # reusing the one persistent browser page
+        page.goto(person_url, wait_until='networkidle', timeout=20000)
 
         # Look for the image using CSS selector
-        img = response.html.find('img#photoUrl', first=True)
-        if img and img.attrs.get('src'):
-            return img.attrs['src']
+        img = page.query_selector('img#photoUrl')
+        if img and img.get_attribute('src'):
+            return img.get_attribute('src')
 
         return None
     except Exception as e:
         print(f"  Error fetching page: {e}")
-        return None
+        return FETCH_ERROR
 
 
 def main():
@@ -57,61 +132,93 @@ def main():
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
 
-    # Create session for requests-html
-    session = HTMLSession()
+    # Pooled session for the raw-HTML fast path
+    session = make_session()
+
+    # Skip people we already have a photo for, or who had none last run
+    existing_names = set(IMAGE_EXT_RE.sub('', f) for f in os.listdir(output_dir))
+    no_image_cache = load_no_image_cache()
 
     # Track statistics
     total = 0
-    downloaded = 0
+    skipped = 0
     no_image = 0
-    failed = 0
-
-    # Read CSV and process each person
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-
-        for row in reader:
-            total += 1
-            name = row['Name']
-            cpj_url = row['cpj.org URL']
-
-            print(f"\n[{total}] Processing: {name}")
-            print(f"  URL: {cpj_url}")
-
-            # Get image URL
-            image_url = get_profile_image(session, cpj_url)
-            if not image_url:
-                print(f"  No image found")
-                no_image += 1
-                continue
-
-            print(f"  Image URL: {image_url}")
-
-            # Determine file extension from URL
-            parsed = urlparse(image_url)
-            ext = os.path.splitext(parsed.path)[1]
-            if not ext or ext not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                ext = '.jpg'  # Default to jpg
-
-            # Create filename
-            safe_name = sanitize_filename(name)
-            filename = f"{safe_name}{ext}"
-            filepath = os.path.join(output_dir, filename)
-
-            # Download image
-            if download_image(image_url, filepath):
-                print(f"  Downloaded: {filename}")
-                downloaded += 1
-            else:
-                failed += 1
-
-            # Be polite - add a small delay between requests
-            time.sleep(0.5)
+    fetch_errors = 0
+
+    # Phase 1: walk the people pages and collect image URLs, sharing one
+    # browser across every render fallback
+    downloads = []
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch()
+        page = browser.new_page(user_agent=USER_AGENT)
+
+        try:
+            with open(csv_file, 'r', encoding='utf-8') as f:
+                # Plain reader + column indices avoids building a dict per row
+                reader = csv.reader(f)
+                header = next(reader)
+                name_col = header.index('Name')
+                url_col = header.index('cpj.org URL')
+
+                for row in reader:
+                    total += 1
+                    name = row[name_col]
+                    cpj_url = row[url_col]
+
+                    safe_name = sanitize_filename(name)
+                    if safe_name in existing_names:
+                        skipped += 1
+                        continue
+                    if name in no_image_cache:
+                        no_image += 1
+                        continue
+
+                    print(f"\n[{total}] Processing: {name}")
+                    print(f"  URL: {cpj_url}")
+
+                    # Get image URL
+                    image_url = get_profile_image(session, page, cpj_url)
+                    if image_url is FETCH_ERROR:
+                        # Don't negative-cache errors; retry next run
+                        fetch_errors += 1
+                        continue
+                    if not image_url:
+                        print(f"  No image found")
+                        no_image += 1
+                        record_no_image(name)
+                        continue
+
+                    print(f"  Image URL: {image_url}")
+
+                    # Determine file extension from URL
+                    parsed = urlparse(image_url)
+                    ext = os.path.splitext(parsed.path)[1]
+                    if not ext or ext not in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
+                        ext = '.jpg'  # Default to jpg
+
+                    # Create filename
+                    filename = f"{safe_name}{ext}"
+                    filepath = os.path.join(output_dir, filename)
+                    downloads.append((image_url, filepath))
+
+                    # Be polite - add a small delay between page fetches
+                    time.sleep(0.5)
+        finally:
+            browser.close()
+            session.close()
+
+    # Phase 2: download all collected images concurrently
+    print(f"\nDownloading {len(downloads)} images...")
+    results = asyncio.run(download_all(downloads))
+    downloaded = sum(1 for ok in results if ok)
+    failed = len(results) - downloaded
 
     # Print summary
     print(f"Total people: {total}")
+    print(f"Skipped (already downloaded): {skipped}")
     print(f"Successfully downloaded: {downloaded}")
     print(f"No image found: {no_image}")
+    print(f"Page fetch errors: {fetch_errors}")
     print(f"Failed downloads: {failed}")
 
 if __name__ == '__main__':
@@ -3,46 +3,102 @@
 Extract profile pictures from gigaza-org.html and save them with their gigaza names.
 """
 
+import asyncio
 import os
 import re
-import requests
-import time
+import aiohttp
+import lxml.html
 
+USER_AGENT = 'Mozilla/5.0 (compatible; folha-cpj/1.0)'
+MAX_CONCURRENT_DOWNLOADS = 16
+
+# Characters that are problematic in filenames
+FILENAME_UNSAFE_TABLE = str.maketrans('', '', '<>:"/\\|?*')
+
+# Strips image extensions when recovering names from existing files
+IMAGE_EXT_RE = re.compile(r'\.(jpg|png|jpeg)$', re.IGNORECASE)
+
+# URLs that failed to download on a previous run; delete the file to retry
+FAILED_CACHE_FILE = '002_failed_downloads.txt'
 
-def parse_gigaza_html(html_content):
-    """Parse HTML to extract names and image URLs."""
-    entries = []
 
-    # Pattern to match image followed by heading
-    pattern = r'<img[^>]*src="([^"]+)"[^>]*>[\s\S]*?<h2[^>]*class="elementor-heading-title[^>]*>([^<]+)</h2>'
+def load_failed_cache():
+    """Load the set of image URLs that failed on earlier runs."""
+    if not os.path.exists(FAILED_CACHE_FILE):
+        return set()
+    with open(FAILED_CACHE_FILE, 'r', encoding='utf-8') as f:
+        return set(line.strip() for line in f if line.strip())
 
-    matches = re.finditer(pattern, html_content)
 
-    for match in matches:
-        image_url = match.group(1)
-        name = match.group(2).strip()
-        entries.append({'name': name, 'imageUrl': image_url})
+def record_failed(urls):
+    """Append failed image URLs to the persistent skip list."""
+    urls = list(urls)
+    if not urls:
+        return
+    with open(FAILED_CACHE_FILE, 'a', encoding='utf-8') as f:
+        for url in urls:
+            f.write(url + '\n')
+
+
+def parse_gigaza_html(html_content):
+    """Parse HTML to extract names and image URLs.
+
+    Each profile is an image followed by an elementor heading; walk the
+    document in order and pair every heading with the image before it.
+    """
+    entries = []
+    pending_image = None
+
+    root = lxml.html.document_fromstring(html_content)
+    for element in root.iter('img', 'h2'):
+        if element.tag == 'img':
+            if pending_image is None and element.get('src'):
+                pending_image = element.get('src')
+        elif 'elementor-heading-title' in element.get('class', ''):
+            if pending_image is not None and element.text:
+                entries.append({'name': element.text.strip(), 'imageUrl': pending_image})
+                pending_image = None
 
     return entries
 
 
 def sanitize_filename(name):
     """Remove or replace characters that are problematic in filenames."""
-    name = re.sub(r'[<>:"/\\|?*]', '', name)
-    name = name.strip()
-    return name
+    return name.translate(FILENAME_UNSAFE_TABLE).strip()
 
 
-def download_image(url, filepath):
-    """Download image from URL to filepath."""
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        return True
-    except Exception as e:
-        raise Exception(f"Failed to download: {e}")
+async def fetch(session, semaphore, name, url, filepath):
+    """Download one image, gated by the shared semaphore."""
+    async with semaphore:
+        # Stream into a .part file and rename on success, so a dropped
+        # connection never leaves a truncated image at the final path
+        partpath = filepath + '.part'
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+                response.raise_for_status()
+                # Stream to disk in chunks so memory stays flat per worker
+                with open(partpath, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(65536):
+                        f.write(chunk)
+            os.replace(partpath, filepath)
+            print(f"✓ Downloaded: {name}")
+            return True
+        except Exception as e:
+            print(f"✗ Failed: {name} - {e}")
+            if os.path.exists(partpath):
+                os.remove(partpath)
+            return False
+
+
+async def download_all(downloads):
+    """Download (name, url, filepath) triples with bounded concurrency."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    connector = aiohttp.TCPConnector(limit=16, limit_per_host=8)
+    async with aiohttp.ClientSession(connector=connector,
+                                     headers={'User-Agent': USER_AGENT}) as session:
+        return await asyncio.gather(
+            *(fetch(session, semaphore, name, url, filepath)
+              for name, url, filepath in downloads))
 
 
 def main():
@@ -59,16 +115,17 @@ def main():
     output_dir = 'profile_pictures'
     os.makedirs(output_dir, exist_ok=True)
 
-    # Check existing files
-    existing_files = os.listdir(output_dir)
-    existing_names = set(re.sub(r'\.(jpg|png|jpeg)$', '', f, flags=re.IGNORECASE)
-                        for f in existing_files)
+    # Check existing files without stat-ing each one
+    with os.scandir(output_dir) as entries:
+        existing_names = set(IMAGE_EXT_RE.sub('', entry.name)
+                             for entry in entries if entry.is_file())
+
+    failed_cache = load_failed_cache()
 
-    downloaded = 0
     skipped = 0
-    failed = 0
 
-    # Process each gigaza entry
+    # Collect downloads for entries we don't have yet
+    downloads = []
     for entry in gigaza_entries:
         gigaza_name = entry['name']
         safe_name = sanitize_filename(gigaza_name)
@@ -79,6 +136,12 @@ def main():
             skipped += 1
             continue
 
+        # Skip URLs that failed on a previous run
+        if entry['imageUrl'] in failed_cache:
+            print(f"⊘ Skipped (failed previously): {gigaza_name}")
+            skipped += 1
+            continue
+
         # Determine file extension from URL
         ext = '.jpg'
         if '.png' in entry['imageUrl'].lower():
@@ -88,17 +151,15 @@ def main():
 
         filename = f"{safe_name}{ext}"
         filepath = os.path.join(output_dir, filename)
+        downloads.append((gigaza_name, entry['imageUrl'], filepath))
 
-        try:
-            download_image(entry['imageUrl'], filepath)
-            print(f"✓ Downloaded: {gigaza_name}")
-            downloaded += 1
-        except Exception as e:
-            print(f"✗ Failed: {gigaza_name} - {e}")
-            failed += 1
+    # Download everything concurrently, bounded by the semaphore
+    results = asyncio.run(download_all(downloads))
+    downloaded = sum(1 for ok in results if ok)
+    failed = len(results) - downloaded
 
-        # Small delay to avoid overwhelming the server
-        time.sleep(0.1)
+    # Remember failures so reruns don't hammer dead URLs
+    record_failed(url for (name, url, filepath), ok in zip(downloads, results) if not ok)
 
     # Generate report
     print(f"Total entries processed: {len(gigaza_entries)}")
@@ -4,32 +4,107 @@ Generate a PDF with one page per journalist showing their photo and information.
 """
 
 import csv
+import gc
 import os
 import re
+import struct
+import tempfile
+from functools import lru_cache
+from multiprocessing import Pool
+import numpy as np
+from pypdf import PdfWriter
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen import canvas
 from PIL import Image
-from difflib import SequenceMatcher
+from rapidfuzz import fuzz
 
 IMAGE_HEIGHT_INCHES = 7.5  # Height of photo in inches (A4 height is ~11.7 inches)
+MAX_IMAGE_PIXELS = 1600  # ~200 DPI for the 7.5-inch photo area
+RESIZE_CACHE_DIR = '.resized_cache'
+PAGES_PER_CHUNK = 50  # Pages rendered per worker before merging
+PDF_WRITE_BUFFER = 1 << 20  # 1 MiB buffer for PDF output files
+
+# Characters that are problematic in filenames
+FILENAME_UNSAFE_TABLE = str.maketrans('', '', '<>:"/\\|?*')
+
+# Strips image extensions when recovering names from existing files
+IMAGE_EXT_RE = re.compile(r'\.(jpg|jpeg|png|gif|webp)$', re.IGNORECASE)
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def read_image_size(path):
+    """Read image dimensions from the file header without decoding pixels.
+    Falls back to PIL for formats not parsed by hand."""
+    with open(path, 'rb') as f:
+        head = f.read(24)
+
+        # PNG: fixed signature, then IHDR width/height at offsets 16/20
+        if head[:8] == b'\x89PNG\r\n\x1a\n':
+            return struct.unpack('>II', head[16:24])
+
+        # JPEG: walk the segment markers to the first SOF frame header
+        if head[:2] == b'\xff\xd8':
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                code = marker[1]
+                if code == 0xFF:
+                    f.seek(-1, 1)
+                    continue
+                if code == 0x01 or 0xD0 <= code <= 0xD9:
+                    continue  # standalone marker, no length field
+                length_bytes = f.read(2)
+                if len(length_bytes) < 2:
+                    break
+                length = struct.unpack('>H', length_bytes)[0]
+                if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                    frame = f.read(5)
+                    height, width = struct.unpack('>HH', frame[1:5])
+                    return width, height
+                f.seek(length - 2, 1)
+
+    with Image.open(path) as img:
+        return img.size
+
+
+def downscale_image(image_path):
+    """Downscale oversized images once, caching the result on disk.
+    Returns (path_to_embed, width, height)."""
+    img_width, img_height = read_image_size(image_path)
+    if max(img_width, img_height) <= MAX_IMAGE_PIXELS:
+        return image_path, img_width, img_height
+
+    cached_path = os.path.join(RESIZE_CACHE_DIR, os.path.basename(image_path))
+    if not os.path.exists(cached_path):
+        os.makedirs(RESIZE_CACHE_DIR, exist_ok=True)
+        with Image.open(image_path) as img:
+            img.thumbnail((MAX_IMAGE_PIXELS, MAX_IMAGE_PIXELS), Image.LANCZOS)
+            img.save(cached_path, quality=85)
+            return cached_path, img.size[0], img.size[1]
+
+    cached_width, cached_height = read_image_size(cached_path)
+    return cached_path, cached_width, cached_height
 
 
 def sanitize_filename(name):
     """Convert name to safe filename."""
-    name = re.sub(r'[<>:"/\\|?*]', '', name)
-    name = name.strip()
-    return name
+    return name.translate(FILENAME_UNSAFE_TABLE).strip()
 
 
 def similarity(str1, str2):
     """Calculate similarity ratio between two strings."""
-    return SequenceMatcher(None, str1.lower(), str2.lower()).ratio()
+    return fuzz.ratio(str1.lower(), str2.lower()) / 100.0
 
 
 def normalize_name(name):
     """Normalize name for better matching."""
-    return re.sub(r'\s+', ' ', name.lower().replace('-', ' ').replace('.', ' ')).strip()
+    return WHITESPACE_RE.sub(' ', name.lower().replace('-', ' ').replace('.', ' ')).strip()
 
 
 def load_crossreference_cache(cache_file):
@@ -60,13 +135,13 @@ def get_available_pictures(image_dir):
     for filename in os.listdir(image_dir):
         if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
             # Remove extension to get the name
-            base_name = re.sub(r'\.(jpg|jpeg|png|gif|webp)$', '', filename, flags=re.IGNORECASE)
+            base_name = IMAGE_EXT_RE.sub('', filename)
             pictures[base_name] = os.path.join(image_dir, filename)
 
     return pictures
 
 
-def find_image_file(name, image_dir, available_pictures, crossref_cache=None, new_crossrefs=None, index=None, overrides_dir=None):
+def find_image_file(name, image_dir, available_pictures, normalized_pictures, crossref_cache=None, new_crossrefs=None, index=None, overrides_dir=None):
     """Find the image file for a given person name, with fuzzy matching fallback.
     Returns tuple: (filepath, source) where source is 'cpj', 'gigaza', 'override', or None
     """
@@ -91,11 +166,9 @@ def find_image_file(name, image_dir, available_pictures, crossref_cache=None, ne
     if "Shaima El-Gazzar" in name:
         return None, None
 
-    # Try exact match first
-    for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-        filepath = os.path.join(image_dir, f"{safe_name}{ext}")
-        if os.path.exists(filepath):
-            return (filepath, 'cpj')
+    # Try exact match first via the preloaded picture index
+    if safe_name in available_pictures:
+        return (available_pictures[safe_name], 'cpj')
 
     # Check crossreference cache
     if crossref_cache and name in crossref_cache:
@@ -113,8 +186,7 @@ def find_image_file(name, image_dir, available_pictures, crossref_cache=None, ne
     best_score = 0.0
 
     for pic_name, pic_path in available_pictures.items():
-        normalized_pic = normalize_name(pic_name)
-        score = similarity(normalized_name, normalized_pic)
+        score = similarity(normalized_name, normalized_pictures[pic_name])
 
         if score > best_score:
             best_score = score
@@ -148,7 +220,19 @@ def find_image_file(name, image_dir, available_pictures, crossref_cache=None, ne
     return (None, None)
 
 
-def wrap_text(c, text, font_name, font_size, max_width):
+@lru_cache(maxsize=None)
+def get_image_reader(path):
+    """Parse each image file once; reused when the same file recurs."""
+    return ImageReader(path)
+
+
+@lru_cache(maxsize=None)
+def string_width(text, font_name, font_size):
+    """Measure text width; cached since the same names recur across runs."""
+    return pdfmetrics.stringWidth(text, font_name, font_size)
+
+
+def wrap_text(text, font_name, font_size, max_width):
     """Wrap text into multiple lines if needed."""
     words = text.split()
     lines = []
@@ -156,7 +240,7 @@ def wrap_text(c, text, font_name, font_size, max_width):
 
     for word in words:
         test_line = line + " " + word if line else word
-        if c.stringWidth(test_line, font_name, font_size) <= max_width:
+        if string_width(test_line, font_name, font_size) <= max_width:
             line = test_line
         else:
             if line:
@@ -169,7 +253,68 @@ def wrap_text(c, text, font_name, font_size, max_width):
     return lines
 
 
-def add_journalist_page(c, name, date, affiliation, image_path):
+def compute_image_layouts(pages):
+    """Vectorize the image placement math for every page up front.
+
+    Returns a dict mapping page index to
+    (embed_path, x_pos, y_pos, display_width, display_height).
+    """
+    width, height = A4
+    name_size = int(IMAGE_HEIGHT_INCHES * 5.5)
+    name_y_position = height * (1 - 2/3)
+    max_text_width = width - 1 * inch
+
+    # Available space: from top to just above name position
+    top_margin = 0.5 * inch
+    image_bottom_margin = 0.3 * inch
+    max_width_img = width - (2 * 0.5 * inch)
+
+    indices = []
+    embed_paths = []
+    img_widths = []
+    img_heights = []
+    available_heights = []
+
+    for i, (name, date, affiliation, image_path) in enumerate(pages):
+        if not (image_path and os.path.exists(image_path)):
+            continue
+        try:
+            embed_path, img_width, img_height = downscale_image(image_path)
+        except Exception as e:
+            print(f"  Error reading image for {name}: {e}")
+            continue
+
+        name_lines = wrap_text(name, "Helvetica-Bold", name_size, max_text_width)
+        indices.append(i)
+        embed_paths.append(embed_path)
+        img_widths.append(img_width)
+        img_heights.append(img_height)
+        available_heights.append(
+            (height - top_margin) - (name_y_position + name_size * len(name_lines) * 1.3 + image_bottom_margin))
+
+    if not indices:
+        return {}
+
+    # Scale every image to fit its slot, preserving aspect ratio
+    img_widths = np.asarray(img_widths, dtype=np.float64)
+    img_heights = np.asarray(img_heights, dtype=np.float64)
+    available_heights = np.asarray(available_heights, dtype=np.float64)
+
+    aspects = img_widths / img_heights
+    wider_than_slot = aspects > max_width_img / available_heights
+    display_widths = np.where(wider_than_slot, max_width_img, available_heights * aspects)
+    display_heights = np.where(wider_than_slot, max_width_img / aspects, available_heights)
+
+    # Center horizontally, position from the top
+    x_positions = (width - display_widths) / 2
+    y_positions = height - top_margin - display_heights
+
+    return {i: (path, x, y, dw, dh)
+            for i, path, x, y, dw, dh in zip(indices, embed_paths, x_positions,
+                                             y_positions, display_widths, display_heights)}
+
+
+def add_journalist_page(c, name, date, affiliation, image_layout):
     """Add a page for one journalist to the PDF."""
     width, height = A4
 
@@ -185,7 +330,7 @@ def add_journalist_page(c, name, date, affiliation, image_path):
     max_text_width = width - 1 * inch
 
     # Wrap name text
-    name_lines = wrap_text(c, name, "Helvetica-Bold", name_size, max_text_width)
+    name_lines = wrap_text(name, "Helvetica-Bold", name_size, max_text_width)
 
     # Calculate text block height
     text_y = name_y_position
@@ -210,7 +355,7 @@ def add_journalist_page(c, name, date, affiliation, image_path):
             word = word.strip()
             test_line = line + ", " + word if line else word
 
-            if c.stringWidth(test_line, "Helvetica-Oblique", affiliation_size) < max_text_width:
+            if string_width(test_line, "Helvetica-Oblique", affiliation_size) < max_text_width:
                 line = test_line
             else:
                 if line:
@@ -222,38 +367,36 @@ def add_journalist_page(c, name, date, affiliation, image_path):
             c.drawCentredString(width/2, text_y, line)
 
     # Add image if available - fill top portion above name
-    if image_path and os.path.exists(image_path):
+    if image_layout:
+        embed_path, x_pos, y_pos, display_width, display_height = image_layout
         try:
-            img = Image.open(image_path)
-            img_width, img_height = img.size
+            c.drawImage(get_image_reader(embed_path), x_pos, y_pos,
+                       width=display_width, height=display_height,
+                       preserveAspectRatio=True, mask='auto')
 
-            # Available space: from top to just above name position
-            top_margin = 0.5 * inch
-            image_bottom_margin = 0.3 * inch
+        except Exception as e:
+            print(f"  Error adding image for {name}: {e}")
 
-            available_height = (height - top_margin) - (name_y_position + name_size * len(name_lines) * 1.3 + image_bottom_margin)
-            max_width_img = width - (2 * 0.5 * inch)
+def render_chunk(chunk_pages, chunk_layouts, output_path):
+    """Render one chunk of pages into its own sub-PDF (runs in a worker)."""
+    with open(output_path, 'wb', buffering=PDF_WRITE_BUFFER) as out:
+        # invariant=1 makes sub-PDF bytes deterministic (fixed timestamps
+        # and IDs), so identical chunks produce identical files
+        c = canvas.Canvas(out, pagesize=A4, pageCompression=1, invariant=1)
 
-            # Calculate scaled dimensions preserving aspect ratio
-            aspect = img_width / img_height
-            if aspect > max_width_img / available_height:
-                display_width = max_width_img
-                display_height = max_width_img / aspect
-            else:
-                display_height = available_height
-                display_width = available_height * aspect
+        for i, (name, date, affiliation, image_path) in enumerate(chunk_pages):
+            add_journalist_page(c, name, date, affiliation, chunk_layouts.get(i))
 
-            # Center the image horizontally
-            x_pos = (width - display_width) / 2
-            # Position from top
-            y_pos = height - top_margin - display_height
+            # Start new page (except for last one)
+            if i < len(chunk_pages) - 1:
+                c.showPage()
 
-            c.drawImage(image_path, x_pos, y_pos,
-                       width=display_width, height=display_height,
-                       preserveAspectRatio=True, mask='auto')
+        c.save()
+
+    # Keep worker memory bounded between chunks
+    gc.collect()
+    return output_path
 
-        except Exception as e:
-            print(f"  Error adding image for {name}: {e}")
 
 def save_crossreference_csv(crossref_file, new_crossrefs):
     """Append new crossreferences to the CSV file and sort it."""
@@ -298,20 +441,23 @@ def main():
     available_pictures = get_available_pictures(image_dir)
     print(f"Found {len(available_pictures)} profile pictures\n")
 
-    # Read all journalists from CSV
+    # Normalize picture names once; the fuzzy loop reuses them per journalist
+    normalized_pictures = {pic_name: normalize_name(pic_name)
+                           for pic_name in available_pictures}
+
+    # Read all journalists from CSV; keep just the columns we use
     journalists = []
     with open(csv_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader)
+        name_col = header.index('Name')
+        date_col = header.index('Date')
+        affiliation_col = header.index('Journalist or Media Worker')
         for row in reader:
-            journalists.append(row)
+            journalists.append((row[name_col], row[date_col], row[affiliation_col]))
 
     total_pages = len(journalists)
 
-    # Create PDF
-    c = canvas.Canvas(output_pdf, pagesize=A4)
-
-    print(f"Creating PDF with {total_pages} pages...")
-
     # Track statistics and new crossreferences
     stats = {
         'total': 0,
@@ -323,20 +469,18 @@ def main():
     }
     new_crossrefs = []
 
-    for idx, person in enumerate(journalists, 1):
-        name = person['Name']
-        date = person['Date']
-        affiliation = person['Journalist or Media Worker']
+    # Pass 1: resolve every journalist's image (may prompt for fuzzy matches)
+    pages = []
+    for idx, (name, date, affiliation) in enumerate(journalists, 1):
+        print(f"[{idx}/{total_pages}] Resolving image for {name}")
 
-        print(f"[{idx}/{total_pages}] Adding page for {name}")
-
-        image_path, source = find_image_file(name, image_dir, available_pictures, crossref_cache, new_crossrefs, index=idx, overrides_dir=overrides_dir)
+        image_path, source = find_image_file(name, image_dir, available_pictures, normalized_pictures, crossref_cache, new_crossrefs, index=idx, overrides_dir=overrides_dir)
 
         if "Roee Idan" in name:
             print("skipping")
             continue
 
-        add_journalist_page(c, name, date, affiliation, image_path)
+        pages.append((name, date, affiliation, image_path))
 
         # Track statistics
         stats['total'] += 1
@@ -351,12 +495,31 @@ def main():
         else:
             stats['no_image'] += 1
 
-        # Start new page (except for last one)
-        if idx < total_pages:
-            c.showPage()
-
-    # Save PDF
-    c.save()
+    # Pass 2: compute all image placements at once, then render the pages
+    image_layouts = compute_image_layouts(pages)
+
+    print(f"Creating PDF with {len(pages)} pages...")
+
+    # Render fixed-size chunks in parallel, then merge the sub-PDFs in order
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jobs = []
+        for chunk_index, start in enumerate(range(0, len(pages), PAGES_PER_CHUNK)):
+            chunk_pages = pages[start:start + PAGES_PER_CHUNK]
+            chunk_layouts = {i - start: image_layouts[i]
+                             for i in range(start, start + len(chunk_pages))
+                             if i in image_layouts}
+            chunk_path = os.path.join(tmpdir, f"chunk_{chunk_index:03d}.pdf")
+            jobs.append((chunk_pages, chunk_layouts, chunk_path))
+
+        with Pool() as pool:
+            chunk_paths = pool.starmap(render_chunk, jobs)
+
+        merger = PdfWriter()
+        for chunk_path in chunk_paths:
+            merger.append(chunk_path)
+        with open(output_pdf, 'wb', buffering=PDF_WRITE_BUFFER) as f:
+            merger.write(f)
+        merger.close()
 
     # Save new crossreferences to CSV
     save_crossreference_csv(crossref_file, new_crossrefs)